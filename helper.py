@@ -1,34 +1,71 @@
-from urllib.parse import urlparse, parse_qs
 from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
 from dotenv import load_dotenv
+from diskcache import Cache
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 import os
+import io
+import html
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import re
-import time
-import random
+from functools import lru_cache
+
+try:
+    import streamlit as st
+except ImportError:
+    # Allow the helpers to be used outside of a Streamlit app
+    st = None
 
 # Load environment variables for local development
 load_dotenv()
 
+# Persistent transcript cache shared across sessions, keyed by (video_id, language)
+_cache = Cache('.cache/transcripts')
+
+# Custom headers to mimic a regular browser
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# Shared session so scraping requests reuse pooled keep-alive connections
+# and back off on rate limiting / server errors
+_session = requests.Session()
+_session.headers.update(HEADERS)
+_adapter = HTTPAdapter(
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+)
+_session.mount('https://', _adapter)
+
+# Patterns for locating caption tracks in the raw video page bytes
+_CAPTION_RE = re.compile(rb'"captionTracks":\[(.*?)\]', re.DOTALL)
+_URL_RE = re.compile(rb'"baseUrl":"(.*?)"')
+_LANG_RE = re.compile(rb'"languageCode":"(.*?)"')
+
+# Matches the 11-character video ID in youtu.be, watch, embed, v and shorts URLs,
+# anchored to the YouTube host and rejecting IDs longer than 11 characters
+_VIDEO_ID_RE = re.compile(
+    r'^(?:https?://)?(?:[\w-]+\.)?(?:youtu\.be/|youtube\.com/(?:watch\?(?:[^&#]*&)*v=|embed/|v/|shorts/))'
+    r'([A-Za-z0-9_-]{11})(?![A-Za-z0-9_-])'
+)
+
 def get_env_variable(key):
     """Get environment variable that works both locally and on Streamlit Cloud"""
     try:
-        import streamlit as st
         return st.secrets.get(key)
     except:
         return os.getenv(key)
 
 def extract_youtube_video_id(url):
-    parsed_url = urlparse(url)
-    
-    if parsed_url.netloc == 'youtu.be':
-        return parsed_url.path[1:]
-    
-    if 'youtube.com' in parsed_url.netloc:
-        query_params = parse_qs(parsed_url.query)
-        return query_params.get('v', [None])[0]
-    
-    return None
+    match = _VIDEO_ID_RE.search(url.strip())
+    return match.group(1) if match else None
 
 common_language_codes = {
     'en': 'English',
@@ -57,16 +94,16 @@ common_language_codes = {
 def get_available_transcripts(video_id):
     """Get list of available transcript languages for a video"""
     try:
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-        available_languages = []
-        
-        for transcript in transcript_list:
-            available_languages.append(transcript.language_code)
-            
-        return available_languages
+        return list(_list_transcript_languages(video_id))
     except Exception as e:
         return []
 
+@lru_cache(maxsize=256)
+def _list_transcript_languages(video_id):
+    # Only successful lookups are cached; failures raise and are retried next call
+    transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+    return tuple(transcript.language_code for transcript in transcript_list)
+
 def transcribe_with_fallback_languages(video_id, preferred_language):
     """Try to get transcript with fallback to other available languages"""
     try:
@@ -88,14 +125,21 @@ def transcribe_with_fallback_languages(video_id, preferred_language):
             transcript = " ".join(chunk["text"] for chunk in transcript_list)
             return transcript, 'en'
         
-        # Try any available language
-        for lang in available_languages:
-            try:
-                transcript_list = YouTubeTranscriptApi.get_transcript(video_id, languages=[lang])
+        # Try any available language, a few at a time to respect YouTube rate limits
+        executor = ThreadPoolExecutor(max_workers=4)
+        try:
+            futures = [executor.submit(YouTubeTranscriptApi.get_transcript, video_id, languages=[lang])
+                       for lang in available_languages]
+            # Read results in list order so manual tracks keep priority over auto-generated ones
+            for lang, future in zip(available_languages, futures):
+                try:
+                    transcript_list = future.result()
+                except:
+                    continue
                 transcript = " ".join(chunk["text"] for chunk in transcript_list)
                 return transcript, lang
-            except:
-                continue
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
         
         raise Exception("Could not retrieve transcript in any available language")
         
@@ -106,61 +150,51 @@ def scrape_youtube_captions(video_id, language='en'):
     """
     Alternative method to scrape captions using a different approach
     This uses a public endpoint that doesn't require authentication
+    
+    Returns a (transcript, track_language) tuple; track_language is None if
+    the caption track doesn't report its language
     """
     try:
-        # Add random delay to avoid rate limiting
-        time.sleep(random.uniform(0.5, 2.0))
-        
-        # Custom headers to mimic a regular browser
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
         # Try to get the video page first
         video_url = f"https://www.youtube.com/watch?v={video_id}"
-        response = requests.get(video_url, headers=headers, timeout=10)
+        response = _session.get(video_url, timeout=10)
         
         if response.status_code != 200:
             raise Exception(f"Could not access video page: {response.status_code}")
         
-        html_content = response.text
-        
-        # Look for caption tracks in the HTML
-        caption_pattern = r'"captionTracks":\[(.*?)\]'
-        caption_match = re.search(caption_pattern, html_content)
+        # Scan the raw page bytes to skip decoding the whole (~1MB) page
+        caption_match = _CAPTION_RE.search(response.content)
         
         if not caption_match:
             raise Exception("No caption tracks found in video page")
         
         caption_data = caption_match.group(1)
         
-        # Extract caption URL
-        url_pattern = r'"baseUrl":"(.*?)"'
-        url_matches = re.findall(url_pattern, caption_data)
+        # Extract the first caption URL
+        url_match = _URL_RE.search(caption_data)
         
-        if not url_matches:
+        if not url_match:
             raise Exception("No caption URLs found")
         
-        # Try the first caption URL
-        caption_url = url_matches[0].replace('\\u0026', '&').replace('\\', '')
+        caption_url = url_match.group(1).decode('utf-8').replace('\\u0026', '&').replace('\\', '')
+        
+        # Read the language of that same track (before the next track's URL)
+        next_url_match = _URL_RE.search(caption_data, url_match.end())
+        track_end = next_url_match.start() if next_url_match else len(caption_data)
+        lang_match = _LANG_RE.search(caption_data, url_match.end(), track_end)
+        track_language = lang_match.group(1).decode('utf-8') if lang_match else None
         
         # Download the caption
-        caption_response = requests.get(caption_url, headers=headers, timeout=10)
+        caption_response = _session.get(caption_url, timeout=10)
         
         if caption_response.status_code != 200:
             raise Exception(f"Could not download captions: {caption_response.status_code}")
         
         # Parse the XML content
-        caption_xml = caption_response.text
+        caption_xml = caption_response.content
         transcript = parse_youtube_xml_captions(caption_xml)
         
-        return transcript
+        return transcript, track_language
         
     except Exception as e:
         raise Exception(f"Caption scraping failed: {str(e)}")
@@ -170,22 +204,20 @@ def parse_youtube_xml_captions(xml_content):
     import xml.etree.ElementTree as ET
     
     try:
-        root = ET.fromstring(xml_content)
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+        
         texts = []
         
-        for text_elem in root.findall('.//text'):
-            if text_elem.text:
-                # Clean up the text
-                clean_text = text_elem.text.strip()
-                # Remove HTML entities
-                clean_text = clean_text.replace('&amp;', '&')
-                clean_text = clean_text.replace('&lt;', '<')
-                clean_text = clean_text.replace('&gt;', '>')
-                clean_text = clean_text.replace('&quot;', '"')
-                clean_text = clean_text.replace('&#39;', "'")
+        # Stream the document so long caption files never build a full tree
+        for _, elem in ET.iterparse(io.BytesIO(xml_content), events=('end',)):
+            if elem.tag == 'text' and elem.text:
+                # Clean up the text and decode any leftover HTML entities
+                clean_text = html.unescape(elem.text.strip())
                 
                 if clean_text:
                     texts.append(clean_text)
+            elem.clear()
         
         return ' '.join(texts)
         
@@ -198,47 +230,78 @@ def transcribe_extractor(url, language):
     if not video_id:
         raise Exception("Invalid YouTube URL")
     
+    transcript, used_language = _fetch_transcript(video_id, language)
+    
+    if used_language and used_language != language:
+        print(f"Note: Transcript retrieved in '{used_language}' instead of requested '{language}'")
+    
+    return transcript
+
+def _method_api(video_id, language):
+    # Method 1: youtube-transcript-api with fallback languages
+    return transcribe_with_fallback_languages(video_id, language)
+
+def _method_scrape(video_id, language):
+    # Method 2: caption scraping
+    return scrape_youtube_captions(video_id, language)
+
+def _method_any(video_id, language):
+    # Method 3: transcript without language specification (the API defaults to English)
+    transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
+    transcript = " ".join(chunk["text"] for chunk in transcript_list)
+    return transcript, 'en'
+
+# Extraction methods in order of preference
+_TRANSCRIPT_METHODS = [
+    ("youtube-transcript-api", _method_api),
+    ("caption scraping", _method_scrape),
+    ("final fallback", _method_any),
+]
+
+@_cache.memoize(expire=604800)
+def _fetch_transcript(video_id, language):
+    """Run the 3 extraction methods concurrently and return a (transcript, used_language) tuple"""
     print(f"Attempting to extract transcript for video ID: {video_id}")
     
-    # Method 1: Try youtube-transcript-api with fallback languages
+    executor = ThreadPoolExecutor(max_workers=len(_TRANSCRIPT_METHODS))
     try:
-        print("Trying youtube-transcript-api with fallback languages...")
-        transcript, used_language = transcribe_with_fallback_languages(video_id, language)
+        futures = {executor.submit(method, video_id, language): index
+                   for index, (_, method) in enumerate(_TRANSCRIPT_METHODS)}
+        results = {}
+        errors = {}
         
-        if used_language != language:
-            print(f"Note: Transcript retrieved in '{used_language}' instead of requested '{language}'")
-        
-        return transcript
-        
-    except Exception as api_error:
-        print(f"youtube-transcript-api failed: {api_error}")
-        
-        # Method 2: Try caption scraping
-        try:
-            print("Trying caption scraping method...")
-            return scrape_youtube_captions(video_id, language)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = futures.pop(future)
+                name = _TRANSCRIPT_METHODS[index][0]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    print(f"{name} failed: {e}")
+                    errors[index] = e
             
-        except Exception as scrape_error:
-            print(f"Caption scraping failed: {scrape_error}")
-            
-            # Method 3: Final fallback - try original API with different approach
-            try:
-                print("Trying final fallback with any available transcript...")
-                # Get any available transcript without language specification
-                transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-                transcript = " ".join(chunk["text"] for chunk in transcript_list)
-                return transcript
-                
-            except Exception as final_error:
-                # Provide detailed error information
-                available_langs = get_available_transcripts(video_id)
-                if available_langs:
-                    raise Exception(f"All methods failed. Available languages for this video: {available_langs}. "
-                                  f"API error: {api_error}. Scraping error: {scrape_error}. Final error: {final_error}")
-                else:
-                    raise Exception("No captions/transcripts are available for this video. "
-                                  "The video either has no captions or they are disabled.")
+            # Return the most preferred successful result once every method
+            # ahead of it has finished, so a faster fallback can't override
+            # a language-aware answer that is still in flight
+            for index in range(len(_TRANSCRIPT_METHODS)):
+                if index in results:
+                    return results[index]
+                if index not in errors:
+                    break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    
+    # Provide detailed error information
+    api_error, scrape_error, final_error = (errors[i] for i in range(len(_TRANSCRIPT_METHODS)))
+    available_langs = get_available_transcripts(video_id)
+    if available_langs:
+        raise Exception(f"All methods failed. Available languages for this video: {available_langs}. "
+                      f"API error: {api_error}. Scraping error: {scrape_error}. Final error: {final_error}")
+    else:
+        raise Exception("No captions/transcripts are available for this video. "
+                      "The video either has no captions or they are disabled.")
 
 def format_docs(retrieved_docs):
-    context_text = "\n\n".join(doc.page_content for doc in retrieved_docs)
+    context_text = "\n\n".join([doc.page_content for doc in retrieved_docs])
     return context_text
\ No newline at end of file
@@ -5,26 +5,27 @@ from langchain_community.vectorstores import FAISS
 from langchain_core.prompts import PromptTemplate
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from helper import common_language_codes, transcribe_extractor, format_docs
+from helper import common_language_codes, transcribe_extractor, format_docs, get_env_variable
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import time
 import os
+import hashlib
+import shutil
+import tempfile
 # Load environment variables
 load_dotenv()
 
 def setup_google_api_key():
     """Setup Google API key for both local development and Streamlit Cloud"""
-    try:
-        # Try to get from Streamlit secrets first (for deployed app)
-        api_key = st.secrets["GOOGLE_API_KEY"]
+    # Streamlit secrets first (for deployed app), then the environment from .env
+    api_key = get_env_variable("GOOGLE_API_KEY")
+    if api_key:
         os.environ["GOOGLE_API_KEY"] = api_key
-    except:
-        # For local development, it should already be in environment from .env
-        # Just make sure it exists
-        if not os.getenv("GOOGLE_API_KEY"):
-            st.error("⚠️ GOOGLE_API_KEY not found! Please set it in Streamlit secrets or .env file")
-            st.stop()
+    elif not os.getenv("GOOGLE_API_KEY"):
+        st.error("⚠️ GOOGLE_API_KEY not found! Please set it in Streamlit secrets or .env file")
+        st.stop()
 
 # Add this function call right after your imports and before initialize_components()
 setup_google_api_key()
@@ -147,7 +148,10 @@ def initialize_components():
     
     parser = StrOutputParser()
     
-    return splitter, embeddings, llm, prompt, parser
+    # Only the retriever differs per video, so the rest of the pipeline is built once
+    tail_chain = prompt | llm | parser
+    
+    return splitter, embeddings, tail_chain
 
 # Initialize session state
 def initialize_session_state():
@@ -162,35 +166,87 @@ def initialize_session_state():
     if 'last_error' not in st.session_state:
         st.session_state.last_error = None
 
-def process_video(url, language_code, splitter, embeddings, llm, prompt, parser):
+# On-disk FAISS indexes shared across sessions, keyed by embedding model and transcript
+FAISS_CACHE_DIR = ".faiss_cache"
+
+@st.cache_data(ttl=86400, show_spinner=False)
+def get_transcript(url, language_code):
+    """Fetch the transcript for a video, cached per (url, language)"""
+    return transcribe_extractor(url, language_code)
+
+def embed_texts(texts, embeddings, batch_size=100, max_workers=8):
+    """Embed texts in batched API calls, sending the batches concurrently"""
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) == 1:
+        return embeddings.embed_documents(batches[0])
+    
+    # Cap concurrency to stay under the embedding API's default QPS limit
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [vector for batch in executor.map(embeddings.embed_documents, batches) for vector in batch]
+
+@st.cache_resource(max_entries=32, ttl=86400, show_spinner=False)
+def build_chain(transcript_text, _splitter, _embeddings, _tail_chain):
+    """Build the QA chain for a transcript, cached per transcript text"""
+    # Reuse an index saved by a previous session for the same transcript and
+    # embedding model (vectors from another model would have the wrong dimension)
+    cache_key = f"{_embeddings.model}\n{transcript_text}"
+    index_hash = hashlib.sha256(cache_key.encode()).hexdigest()
+    index_path = os.path.join(FAISS_CACHE_DIR, index_hash)
+    
+    vector_store = None
+    if os.path.exists(index_path):
+        try:
+            vector_store = FAISS.load_local(index_path, _embeddings, allow_dangerous_deserialization=True)
+        except Exception as e:
+            # Unreadable entry (e.g. written by another langchain/faiss version): rebuild it
+            print(f"Discarding unreadable FAISS cache entry {index_path}: {e}")
+            shutil.rmtree(index_path, ignore_errors=True)
+    
+    if vector_store is None:
+        chunks = _splitter.create_documents([transcript_text])
+        
+        if not chunks:
+            raise Exception("Failed to create document chunks from transcript.")
+        
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = embed_texts(texts, _embeddings)
+        vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), _embeddings)
+        
+        # Save to a temp directory and rename it into place so an interrupted
+        # save never leaves a half-written entry behind
+        os.makedirs(FAISS_CACHE_DIR, exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=FAISS_CACHE_DIR, prefix=".tmp-")
+        try:
+            vector_store.save_local(tmp_path)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            # Another session may have stored the same index first; caching is best effort
+            print(f"Could not cache FAISS index {index_path}: {e}")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+    
+    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 4})
+    
+    parallel_chain = RunnableParallel({
+        'context': retriever | RunnableLambda(format_docs),
+        'question': RunnablePassthrough()
+    })
+    
+    return parallel_chain | _tail_chain
+
+def process_video(url, language_code, splitter, embeddings, tail_chain):
     """Process YouTube video and create QA chain"""
     try:
         # Clear any previous errors
         st.session_state.last_error = None
         
         with st.spinner("🎬 Extracting transcript..."):
-            transcript = transcribe_extractor(url, language_code)
+            transcript = get_transcript(url, language_code)
         
         if not transcript or len(transcript.strip()) < 50:
             raise Exception("Transcript is too short or empty. The video might not have captions.")
         
-        with st.spinner("📄 Processing transcript..."):
-            chunks = splitter.create_documents([transcript])
-        
-        if not chunks:
-            raise Exception("Failed to create document chunks from transcript.")
-        
         with st.spinner("🔍 Creating vector database..."):
-            vector_store = FAISS.from_documents(chunks, embeddings)
-            retriever = vector_store.as_retriever(search_type="mmr", search_kwargs={"k": 4})
-        
-        with st.spinner("⚡ Setting up Q&A chain..."):
-            parallel_chain = RunnableParallel({
-                'context': retriever | RunnableLambda(format_docs),
-                'question': RunnablePassthrough()
-            })
-            
-            main_chain = parallel_chain | prompt | llm | parser
+            main_chain = build_chain(transcript, splitter, embeddings, tail_chain)
         
         return main_chain, transcript[:500] + "..." if len(transcript) > 500 else transcript
     
@@ -217,7 +273,7 @@ def streamlit_main():
     st.markdown('<div class="sub-header">Ask questions about any YouTube video transcript!</div>', unsafe_allow_html=True)
     
     # Initialize components and session state
-    splitter, embeddings, llm, prompt, parser = initialize_components()
+    splitter, embeddings, tail_chain = initialize_components()
     initialize_session_state()
     
     # Sidebar for video input
@@ -236,16 +292,15 @@ def streamlit_main():
             help="Paste the YouTube video URL here"
         )
         
-        # Language selection
-        language_display = st.selectbox(
+        # Language selection (options are codes, shown by display name)
+        language_code = st.selectbox(
             "Select Language:",
-            options=list(common_language_codes.values()),
+            options=list(common_language_codes),
+            format_func=common_language_codes.get,
             index=0,
             help="Choose the language of the video"
         )
-        
-        # Get language code from display name
-        language_code = [code for code, lang in common_language_codes.items() if lang == language_display][0]
+        language_display = common_language_codes[language_code]
         
         # Process video button
         if st.button("🚀 Process Video", type="primary"):
@@ -256,7 +311,7 @@ def streamlit_main():
                     st.session_state.current_video_url = video_url
                 
                 qa_chain, transcript_preview = process_video(
-                    video_url, language_code, splitter, embeddings, llm, prompt, parser
+                    video_url, language_code, splitter, embeddings, tail_chain
                 )
                 
                 if qa_chain: